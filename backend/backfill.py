@@ -0,0 +1,319 @@
+"""
+Voice Recorder Backfill
+- Re-transcribes recordings of one folder within a date range
+- Restores audio from git history (processed files are git rm'd) or a local audio directory
+- Transcribes in parallel worker processes, one Whisper model per worker
+- Writes to a separate "Backfill" document series, never the live volumes
+- Progress is saved after every entry, so an interrupted run resumes where it stopped
+
+Usage:
+    python backend/backfill.py <folder_id> --since 2025-12-01 --until 2026-01-01 [--workers N] [--audio-dir DIR]
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import logging
+import subprocess
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from recording_metadata import parse_filename
+from sync_logging import worker_log_queue, init_worker_logging
+
+from sync_and_process import (
+    project_root, RECORDINGS_DIR, LOG_DIR,
+    GoogleDocManager, load_folder_config, transcribe_audio,
+    format_transcript, get_or_create_doc, MAX_DOC_SIZE, SEGMENT_RE
+)
+
+# ======== Configuration ========
+BACKFILL_DIR = os.path.join(LOG_DIR, 'backfill')
+AUDIO_EXTENSIONS = ('.webm', '.m4a', '.wav', '.mp3')
+WORKER_MEMORY_GB = 3  # Rough RAM needed per worker (one Whisper model each)
+
+SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+
+
+def git_output(args, binary=False):
+    """Run a git command and return its stdout (None on failure)"""
+    try:
+        result = subprocess.run(
+            ['git'] + args,
+            cwd=project_root,
+            capture_output=True,
+            text=not binary,
+            check=True
+        )
+        return result.stdout
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode('utf-8', 'replace') if binary else e.stderr
+        logging.error(f"Git command failed: git {' '.join(args)}\n{stderr}")
+        return None
+
+
+def find_deleted_recordings(folder_id):
+    """Map filename -> (commit, path) for recordings removed from the folder in git history"""
+    rel_folder = f"recordings/{folder_id}/"
+    out = git_output(['log', '--diff-filter=D', '--name-only', '--pretty=format:%H', '--', rel_folder])
+    found = {}
+    commit = None
+    for line in (out or '').splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if SHA_RE.match(line):
+            commit = line
+        elif commit and line.lower().endswith(AUDIO_EXTENSIONS):
+            # git log is newest first: keep the most recent deletion
+            found.setdefault(os.path.basename(line), (commit, line))
+    return found
+
+
+def collect_recordings(folder_id, since, until, audio_dir=None):
+    """
+    Find recordings in [since, until) and where to get them from.
+    Returns a sorted list of (recorded_at, filename, source) where source is
+    either a local path or a (commit, path) pair from git history.
+    """
+    sources = {}
+    for filename, ref in find_deleted_recordings(folder_id).items():
+        sources[filename] = ref
+
+    # Local copies win over git history
+    local_dirs = [os.path.join(RECORDINGS_DIR, folder_id)]
+    if audio_dir:
+        local_dirs.append(audio_dir)
+    for d in local_dirs:
+        if os.path.isdir(d):
+            for filename in os.listdir(d):
+                if filename.lower().endswith(AUDIO_EXTENSIONS):
+                    sources[filename] = os.path.join(d, filename)
+
+    # Segmented uploads become one recording whose source is the ordered part list
+    parts = {}
+    for filename in list(sources):
+        m = SEGMENT_RE.match(filename)
+        if m:
+            parts.setdefault(m.group(1) + m.group(4), []).append((int(m.group(2)), sources.pop(filename)))
+    for merged_name, numbered in parts.items():
+        sources[merged_name] = [source for _, source in sorted(numbered, key=lambda p: p[0])]
+    
+    recordings = []
+    for filename, source in sources.items():
+        parsed = parse_filename(filename)
+        if parsed and parsed['kind'] == 'recording' and since <= parsed['recorded_at'] < until:
+            recordings.append((parsed['recorded_at'], filename, source))
+    recordings.sort()
+    return recordings
+
+
+def restore_audio(filename, source, cache_dir):
+    """Return a local path for the recording, extracting it from git if needed"""
+    if isinstance(source, str):
+        return source
+    
+    if isinstance(source, list):
+        # Segment set: restore each part, then concatenate in order
+        dest = os.path.join(cache_dir, filename)
+        if not os.path.exists(dest):
+            os.makedirs(cache_dir, exist_ok=True)
+            part_paths = [restore_audio(f"{filename}.part{i + 1}", part, cache_dir)
+                          for i, part in enumerate(source)]
+            if None in part_paths:
+                return None
+            with open(dest + '.part', 'wb') as dst:
+                for path in part_paths:
+                    with open(path, 'rb') as src:
+                        shutil.copyfileobj(src, dst)
+            os.replace(dest + '.part', dest)
+            for path in part_paths:
+                if path.startswith(cache_dir):
+                    os.remove(path)
+        return dest
+
+    commit, path = source
+    dest = os.path.join(cache_dir, filename)
+    if not os.path.exists(dest):
+        data = git_output(['show', f"{commit}^:{path}"], binary=True)
+        if data is None:
+            return None
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(dest + '.part', 'wb') as f:
+            f.write(data)
+        os.replace(dest + '.part', dest)
+    return dest
+
+
+def total_memory():
+    """Physical memory in bytes, or None if it can't be determined"""
+    try:
+        import psutil
+        return psutil.virtual_memory().total
+    except ImportError:
+        pass
+    if hasattr(os, 'sysconf') and 'SC_PHYS_PAGES' in os.sysconf_names:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    if sys.platform == 'win32':
+        import ctypes
+
+        class MemoryStatusEx(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong)] + [
+                (name, ctypes.c_ulonglong) for name in (
+                    'ullTotalPhys', 'ullAvailPhys', 'ullTotalPageFile', 'ullAvailPageFile',
+                    'ullTotalVirtual', 'ullAvailVirtual', 'ullAvailExtendedVirtual')
+            ]
+
+        status = MemoryStatusEx()
+        status.dwLength = ctypes.sizeof(status)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullTotalPhys
+    return None
+
+
+def default_workers():
+    """As many workers as both the cores and the memory (WORKER_MEMORY_GB each) allow"""
+    cpus = os.cpu_count() or 1
+    memory = total_memory()
+    if memory is None:
+        return 1
+    return max(1, min(cpus, int(memory // (WORKER_MEMORY_GB * 1024 ** 3))))
+
+
+def _init_worker(threads, log_queue):
+    """
+    Pool initializer: log through the parent's handlers, and split the cores
+    between workers instead of each using all of them
+    """
+    init_worker_logging(log_queue)
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _transcribe_worker(filename, source, cache_dir):
+    """
+    Runs in a worker process; the transcriber is loaded once per process.
+    Audio is restored here, just before it is needed, and removed right after,
+    so the cache holds at most one file per worker.
+    Returns (restored, text).
+    """
+    path = restore_audio(filename, source, cache_dir)
+    if not path:
+        return False, None
+    try:
+        return True, transcribe_audio(path)
+    finally:
+        if path.startswith(cache_dir):
+            os.remove(path)
+
+
+def load_progress(path):
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logging.error(f"Error loading backfill progress: {e}")
+    return {'processed_files': [], 'current_doc': None, 'volume': 1}
+
+
+def save_progress(path, progress):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(progress, f, indent=2, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-transcribe a folder's recordings for a date range")
+    parser.add_argument('folder', help="Folder id from folders.json, e.g. LifeVoice")
+    parser.add_argument('--since', required=True, help="First day to include, YYYY-MM-DD")
+    parser.add_argument('--until', required=True, help="Day to stop at (exclusive), YYYY-MM-DD")
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help=f"Transcription worker processes (default: cores, at most one per {WORKER_MEMORY_GB} GB RAM)")
+    parser.add_argument('--audio-dir', help="Extra local directory holding archived recordings")
+    args = parser.parse_args()
+
+    since = datetime.strptime(args.since, "%Y-%m-%d")
+    until = datetime.strptime(args.until, "%Y-%m-%d")
+
+    folder = next((f for f in load_folder_config() if f['id'] == args.folder), None)
+    if not folder:
+        logging.error(f"Unknown folder '{args.folder}'")
+        return 1
+
+    label = f"{args.since}~{args.until}"
+    run_id = f"{args.folder}_{args.since}_{args.until}"
+    progress_file = os.path.join(BACKFILL_DIR, f"{run_id}.json")
+    cache_dir = os.path.join(BACKFILL_DIR, 'audio', run_id)
+    # Separate series, e.g. "Life Voice [Backfill 2025-12-01~2026-01-01] Transcripts - Vol 1"
+    series_name = f"{folder['name']} [Backfill {label}]"
+
+    logging.info("=" * 50)
+    logging.info(f"Backfill [{args.folder}] {label}")
+
+    progress = load_progress(progress_file)
+    done = set(progress['processed_files'])
+    recordings = [r for r in collect_recordings(args.folder, since, until, args.audio_dir)
+                  if r[1] not in done]
+    if not recordings:
+        logging.info("Nothing to backfill")
+        return 0
+    logging.info(f"{len(recordings)} recording(s) to re-transcribe ({len(done)} already done)")
+
+    try:
+        gdocs = GoogleDocManager()
+    except FileNotFoundError as e:
+        logging.error(str(e))
+        return 1
+
+    workers = max(1, args.workers)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    logging.info(f"{workers} worker(s), {threads} thread(s) each")
+
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(threads, worker_log_queue())) as pool:
+        # map() transcribes in parallel but yields in recording order
+        results = pool.map(_transcribe_worker,
+                           [filename for _, filename, _ in recordings],
+                           [source for _, _, source in recordings],
+                           [cache_dir] * len(recordings))
+        for (recorded_at, filename, _), (restored, text) in zip(recordings, results):
+            if not restored:
+                logging.error(f"❌ Could not restore audio: {filename}")
+                continue
+            if not text or not text.strip():
+                text = "[No speech detected]"
+
+            entry = format_transcript(recorded_at.strftime("%Y-%m-%d %H:%M:%S"), text.strip())
+
+            doc_id, doc_name, current_size = get_or_create_doc(gdocs, progress, series_name)
+            if doc_id and current_size + len(entry) > MAX_DOC_SIZE:
+                progress['volume'] = progress.get('volume', 1) + 1
+                progress['current_doc'] = None
+                doc_id, doc_name, current_size = get_or_create_doc(gdocs, progress, series_name)
+            if not doc_id:
+                logging.error("Failed to get/create backfill document, stopping")
+                break
+
+            if gdocs.append_content(doc_id, entry):
+                progress['processed_files'].append(filename)
+                save_progress(progress_file, progress)
+                total += 1
+                logging.info(f"✅ {filename} -> '{doc_name}'")
+            else:
+                logging.error(f"❌ Failed to append: {filename}")
+
+    logging.info(f"Backfill done: {total} recording(s) re-transcribed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,23 @@
+"""
+Whisper Processor CLI
+- Transcribes one or many audio files with the shared WhisperTranscriber
+- Accepts files, directories, glob patterns, or a list of paths on stdin
+- Loads the model once per worker process and streams results as JSONL
+
+Usage:
+    python processor.py <audio_file_path>
+    python processor.py recordings/LifeVoice "old/**/*.webm" --workers 4 > results.jsonl
+    find . -name "*.m4a" | python processor.py - --workers 2
+    python processor.py recordings/LifeVoice --profile
+"""
 import sys
 import os
+import glob
+import json
+import time
+import argparse
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Setup Path to include 'Util' directory
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -8,39 +25,45 @@ project_root = os.path.dirname(current_dir) # voice_recorder
 python_scripts_root = os.path.dirname(project_root) # PythonScripts
 util_path = os.path.join(python_scripts_root, 'Util')
 
+# stdout carries results only; diagnostics go to stderr
 if os.path.exists(util_path):
     if util_path not in sys.path:
         sys.path.append(util_path)
-    print(f"Added {util_path} to sys.path")
 else:
-    print(f"Warning: Util directory not found at {util_path}")
+    print(f"Warning: Util directory not found at {util_path}", file=sys.stderr)
+
+from recording_metadata import probe_audio
+
+AUDIO_EXTENSIONS = ('.webm', '.m4a', '.wav', '.mp3')
 
 transcriber_instance = None
 
-try:
-    from multimedia_to_text import WhisperTranscriber
-    # Initialize once if possible, or lazy init
-    # We will lazy init in the function or global scope if arguments aren't needed
-    # Assuming default init is fine. If it requires model_path, we might need to adjust.
-    try:
-        transcriber_instance = WhisperTranscriber()
-    except Exception as e:
-        print(f"Error initializing WhisperTranscriber: {e}")
-        
-except ImportError as e:
-    print(f"ImportError: {e}")
+
+def get_transcriber():
+    """Load WhisperTranscriber once per process"""
+    global transcriber_instance
+    if transcriber_instance is None:
+        try:
+            from multimedia_to_text import WhisperTranscriber
+            transcriber_instance = WhisperTranscriber()
+        except ImportError as e:
+            print(f"ImportError: {e}", file=sys.stderr)
+        except Exception as e:
+            print(f"Error initializing WhisperTranscriber: {e}", file=sys.stderr)
+    return transcriber_instance
+
 
 def process_audio(file_path):
     """
     Process the audio file using the imported transcriber.
     Returns the transcription text.
     """
-    global transcriber_instance
+    transcriber_instance = get_transcriber()
     if not transcriber_instance:
         return "Error: Transcriber module not loaded or initialized."
 
-    print(f"Transcribing {file_path}...")
-    
+    print(f"Transcribing {file_path}...", file=sys.stderr)
+
     try:
         # Check methods
         if hasattr(transcriber_instance, 'transcribe_to_text'):
@@ -51,15 +74,134 @@ def process_audio(file_path):
             return "Error: No suitable transcribe method found on WhisperTranscriber."
 
     except Exception as e:
-        print(f"Error during transcription: {e}")
+        print(f"Error during transcription: {e}", file=sys.stderr)
         return f"Error: {str(e)}"
 
+
+def transcribe_file(file_path):
+    """Transcribe one file and return a result record for JSONL output"""
+    try:
+        duration = probe_audio(file_path)['duration']
+    except OSError:
+        duration = None
+
+    start = time.perf_counter()
+    text = process_audio(file_path)
+    elapsed = time.perf_counter() - start
+
+    record = {
+        'path': file_path,
+        'text': text,
+        'duration': round(duration, 3) if duration else None,
+        'elapsed': round(elapsed, 3),
+        'rtf': round(elapsed / duration, 4) if duration else None,
+    }
+    if isinstance(text, str) and text.startswith('Error:'):
+        record['text'] = None
+        record['error'] = text[len('Error:'):].strip()
+    return record
+
+
+def expand_inputs(inputs):
+    """Expand files, directories (recursive) and glob patterns into a sorted list of audio files"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(AUDIO_EXTENSIONS))
+        elif glob.has_magic(item):
+            paths.extend(p for p in glob.glob(item, recursive=True) if os.path.isfile(p))
+        else:
+            paths.append(item)
+
+    seen = set()
+    unique = []
+    for p in paths:
+        if p not in seen:
+            seen.add(p)
+            unique.append(p)
+    return sorted(unique)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe audio files with Whisper")
+    parser.add_argument('inputs', nargs='*',
+                        help="Audio files, directories or glob patterns; '-' (or none) reads paths from stdin")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes, each loading its own model (default: 1)")
+    parser.add_argument('--format', choices=['text', 'jsonl'],
+                        help="Output format (default: text for a single file, jsonl otherwise)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile model load / probe / transcribe stages into logs/profiles/")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile:
+        from profiling import RunProfiler
+        logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+        if args.workers > 1:
+            print("--profile runs in a single process; ignoring --workers", file=sys.stderr)
+            args.workers = 1
+        profiler = RunProfiler('processor')
+        profiler.instrument(sys.modules[__name__], {
+            'get_transcriber': 'load_model',
+            'probe_audio': 'probe',
+            'process_audio': 'transcribe',
+        })
+
+    try:
+        return run(args, parser)
+    finally:
+        if profiler:
+            profiler.finish()
+
+
+def run(args, parser):
+    """Expand the inputs, transcribe them and emit the results"""
+
+    inputs = [i for i in args.inputs if i != '-']
+    if '-' in args.inputs or not args.inputs:
+        if sys.stdin.isatty():
+            parser.print_usage(sys.stderr)
+            return 1
+        inputs.extend(line.strip() for line in sys.stdin if line.strip())
+
+    paths = expand_inputs(inputs)
+    if not paths:
+        print("No audio files found", file=sys.stderr)
+        return 1
+
+    output_format = args.format or ('text' if len(args.inputs) == 1 and len(paths) == 1 else 'jsonl')
+    if output_format == 'text' and len(paths) == 1:
+        print("Transcription Result:")
+        print(process_audio(paths[0]))
+        return 0
+
+    def emit(record):
+        if output_format == 'jsonl':
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+        else:
+            print(f"=== {record['path']}")
+            print(record['text'] if record['text'] is not None else f"Error: {record['error']}", flush=True)
+
+    failed = 0
+    if args.workers <= 1:
+        for path in paths:
+            record = transcribe_file(path)
+            failed += 'error' in record
+            emit(record)
+    else:
+        # Each worker loads the model once in its initializer; results stream as they finish
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=get_transcriber) as pool:
+            futures = [pool.submit(transcribe_file, path) for path in paths]
+            for future in as_completed(futures):
+                record = future.result()
+                failed += 'error' in record
+                emit(record)
+
+    print(f"Done: {len(paths) - failed}/{len(paths)} file(s) transcribed", file=sys.stderr)
+    return 1 if failed else 0
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python processor.py <audio_file_path>")
-        sys.exit(1)
-    
-    path = sys.argv[1]
-    result = process_audio(path)
-    print("Transcription Result:")
-    print(result)
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Run Profiler (--profile)
+- Wraps pipeline functions in named stages only when profiling is on
+  (nothing is patched otherwise, so a normal run pays no overhead)
+- Per stage: cProfile stats (.pstats), own wall/CPU time (nested stages excluded), peak RSS
+- A sampling thread records the main thread's Python stack into
+  stacks.collapsed (flamegraph.pl / speedscope format), rooted at the stage name
+- Output: logs/profiles/<name>_<timestamp>/
+"""
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import functools
+import threading
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+# ======== Configuration ========
+PROFILE_DIR = os.path.join(project_root, 'logs', 'profiles')
+SAMPLE_INTERVAL = 0.01  # Seconds between stack / RSS samples
+
+
+def _current_rss():
+    """Resident set size of this process in bytes, or None if unavailable"""
+    if psutil:
+        return psutil.Process().memory_info().rss
+    if sys.platform.startswith('linux'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                    'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+                    'PagefileUsage', 'PeakPagefileUsage')
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize
+    return None
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = 0
+
+
+class RunProfiler:
+    def __init__(self, name):
+        self.run_dir = os.path.join(PROFILE_DIR, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        self.stages = {}
+        self.stack = []
+        self.nested = []  # Per active stage: [wall, cpu] spent in stages nested inside it
+        self.stacks = {}
+        self.lock = threading.Lock()
+        self.thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+        self._sampler.start()
+
+    # --- Stages ---
+    def _enter(self, name):
+        stage = self.stages.setdefault(name, _Stage(name))
+        if self.stack:
+            self.stack[-1].profile.disable()
+        with self.lock:
+            self.stack.append(stage)
+        self.nested.append([0.0, 0.0])
+        stage.calls += 1
+        self._note_rss()
+        stage.profile.enable()
+        return stage, time.perf_counter(), time.process_time()
+
+    def _exit(self, stage, wall_start, cpu_start):
+        stage.profile.disable()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        nested_wall, nested_cpu = self.nested.pop()
+        # Each stage reports its own time; the enclosing stage gets it as nested time
+        stage.wall += wall - nested_wall
+        stage.cpu += cpu - nested_cpu
+        if self.nested:
+            self.nested[-1][0] += wall
+            self.nested[-1][1] += cpu
+        self._note_rss()
+        with self.lock:
+            self.stack.pop()
+        if self.stack:
+            self.stack[-1].profile.enable()
+
+    def wrap(self, func, name):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Time spent in a nested stage is attributed to that stage only
+            token = self._enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._exit(*token)
+        return wrapper
+
+    def instrument(self, target, stages):
+        """Replace target.<attr> with a stage-wrapped version for each {attr: stage_name}"""
+        for attr, name in stages.items():
+            setattr(target, attr, self.wrap(getattr(target, attr), name))
+
+    # --- Sampling ---
+    def _note_rss(self):
+        try:
+            rss = _current_rss()
+        except Exception:
+            rss = None
+        if rss:
+            with self.lock:
+                for stage in self.stack:
+                    stage.peak_rss = max(stage.peak_rss, rss)
+
+    def _sample_loop(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            with self.lock:
+                root = self.stack[-1].name if self.stack else '(none)'
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_filename != __file__:  # Hide the stage wrappers themselves
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ';'.join([f"stage:{root}"] + frames[::-1])
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self._note_rss()
+
+    # --- Output ---
+    def finish(self):
+        """Stop sampling and write pstats, collapsed stacks and a summary for this run"""
+        self._stop.set()
+        self._sampler.join()
+        os.makedirs(self.run_dir, exist_ok=True)
+
+        summary = {}
+        for name, stage in self.stages.items():
+            stage.profile.dump_stats(os.path.join(self.run_dir, f"{name}.pstats"))
+            summary[name] = {
+                'calls': stage.calls,
+                'wall_sec': round(stage.wall, 3),
+                'cpu_sec': round(stage.cpu, 3),
+                'peak_rss_mb': round(stage.peak_rss / 1048576, 1) if stage.peak_rss else None,
+            }
+
+        with open(os.path.join(self.run_dir, 'stacks.collapsed'), 'w', encoding='utf-8') as f:
+            for key, count in sorted(self.stacks.items()):
+                f.write(f"{key} {count}\n")
+        with open(os.path.join(self.run_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+        logging.info(f"Profile written to {self.run_dir}")
+        for name, s in sorted(summary.items(), key=lambda kv: -kv[1]['wall_sec']):
+            logging.info(f"  {name}: {s['calls']} call(s), {s['wall_sec']}s wall, "
+                         f"{s['cpu_sec']}s cpu, peak RSS {s['peak_rss_mb']} MB")
+        return summary
+
+
+def print_stage_stats(pstats_file, limit=20):
+    """Show the top functions of one stage's .pstats file by cumulative time"""
+    pstats.Stats(pstats_file).sort_stats('cumulative').print_stats(limit)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python profiling.py <stage.pstats> [limit]")
+        sys.exit(1)
+    print_stage_stats(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 20)
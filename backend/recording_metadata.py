@@ -0,0 +1,501 @@
+"""
+Recording Metadata
+- Parses recording_* / text_input_* filenames into real datetimes (one compiled pattern)
+- Reads duration and codec from WebM / M4A / WAV / MP3 headers without decoding audio
+- Keeps a persistent index (logs/recording_metadata.json) for ordering, scheduling and reporting
+
+Usage:
+    python backend/recording_metadata.py [folder_id]
+"""
+import os
+import re
+import sys
+import json
+import struct
+from datetime import datetime
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+# ======== Configuration ========
+METADATA_FILE = os.path.join(project_root, 'logs', 'recording_metadata.json')
+HEAD_BYTES = 64 * 1024  # WAV / MP3 info always sits at the start of the file
+
+# recording_2025-12-30T10-09-57-767Z.webm, text_input_2025-12-30T10-09-57-767Z.txt,
+# recording_2025-12-30T10-09-57-767Z.part0003-end.webm
+# Times come from the browser's toISOString(), i.e. UTC.
+FILENAME_RE = re.compile(
+    r'^(?P<kind>recording|text_input)_'
+    r'(?P<date>\d{4}-\d{2}-\d{2})T(?P<hh>\d{2})-(?P<mm>\d{2})-(?P<ss>\d{2})(?:-(?P<ms>\d{1,3}))?Z?'
+    r'(?:\.part(?P<part>\d{4})(?P<end>-end)?)?'
+    r'\.(?P<ext>\w+)$'
+)
+
+
+def parse_filename(filename):
+    """
+    Parse a recording / text input filename.
+    Returns {'kind', 'recorded_at', 'part', 'is_last_part', 'ext'} or None if it doesn't match.
+    """
+    m = FILENAME_RE.match(os.path.basename(filename))
+    if not m:
+        return None
+    try:
+        recorded_at = datetime.strptime(
+            f"{m.group('date')} {m.group('hh')}:{m.group('mm')}:{m.group('ss')}",
+            "%Y-%m-%d %H:%M:%S"
+        )
+    except ValueError:
+        return None
+    if m.group('ms'):
+        recorded_at = recorded_at.replace(microsecond=int(m.group('ms').ljust(3, '0')) * 1000)
+    return {
+        'kind': m.group('kind'),
+        'recorded_at': recorded_at,
+        'part': int(m.group('part')) if m.group('part') else None,
+        'is_last_part': bool(m.group('end')),
+        'ext': m.group('ext').lower(),
+    }
+
+
+# ======== Header probes ========
+
+def _empty_info():
+    return {'codec': None, 'duration': None, 'channels': None, 'sample_rate': None}
+
+
+# --- WebM / Matroska (EBML) ---
+_EBML_MASTERS = {
+    0x1A45DFA3,  # EBML header
+    0x18538067,  # Segment
+    0x1549A966,  # Info
+    0x1654AE6B,  # Tracks
+    0xAE,        # TrackEntry
+    0xE1,        # Audio
+    0x1F43B675,  # Cluster
+    0xA0,        # BlockGroup
+}
+_EBML_CLUSTER = 0x1F43B675
+_EBML_VALUES = {0x2AD7B1, 0x4489, 0x86, 0x9F, 0xB5, 0xE7}  # Elements whose payload we read
+
+
+def _read_vint(data, pos, keep_marker=False):
+    first = data[pos]
+    length, mask = 1, 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8:
+        raise ValueError("Invalid EBML varint")
+    value = first if keep_marker else first & (mask - 1)
+    for i in range(1, length):
+        value = (value << 8) | data[pos + i]
+    return value, length
+
+
+def _read_ebml_header(f, pos):
+    """Return (id, size, size_unknown, body_offset) of the element at pos"""
+    f.seek(pos)
+    head = f.read(12)
+    eid, n = _read_vint(head, 0, keep_marker=True)
+    size, m = _read_vint(head, n)
+    return eid, size, size == (1 << (7 * m)) - 1, pos + n + m
+
+
+def _probe_webm(f, file_size):
+    """
+    Walk EBML element headers, seeking past payloads we don't need.
+    MediaRecorder files usually have no Duration, so the duration falls back
+    to the last block timestamp: sized clusters are skipped whole and only the
+    last one is scanned; unknown-size clusters are walked block header by block header.
+    """
+    info = _empty_info()
+    state = {'timecode_scale': 1000000, 'duration_ticks': None, 'last_block_tc': None, 'cluster_tc': 0}
+
+    def walk(pos, end, skip_sized_clusters):
+        last_cluster = None
+        while pos < end:
+            eid, size, unknown, body = _read_ebml_header(f, pos)
+            if eid == _EBML_CLUSTER:
+                state['cluster_tc'] = 0
+                if skip_sized_clusters and not unknown:
+                    last_cluster = (body, min(body + size, end))
+                    pos = body + size
+                    continue
+            if eid in _EBML_MASTERS:
+                pos = body
+                continue  # Children follow immediately, sized or not
+            if unknown:
+                break
+            pos = body + size
+            f.seek(body)
+
+            if eid in (0xA3, 0xA1):  # SimpleBlock / Block: track number + 16-bit relative timecode
+                payload = f.read(min(size, 11))
+                _, tn = _read_vint(payload, 0)
+                rel_tc = struct.unpack('>h', payload[tn:tn + 2])[0]
+                block_tc = state['cluster_tc'] + rel_tc
+                if state['last_block_tc'] is None or block_tc > state['last_block_tc']:
+                    state['last_block_tc'] = block_tc
+            elif eid in _EBML_VALUES:
+                payload = f.read(size)
+                if eid == 0x2AD7B1:  # TimecodeScale
+                    state['timecode_scale'] = int.from_bytes(payload, 'big')
+                elif eid == 0x4489 and size in (4, 8):  # Duration (float ticks)
+                    state['duration_ticks'] = struct.unpack('>f' if size == 4 else '>d', payload)[0]
+                elif eid == 0x86:  # CodecID, e.g. A_OPUS
+                    codec = payload.decode('ascii', 'replace').rstrip('\x00')
+                    info['codec'] = codec[2:].lower() if codec.startswith('A_') else codec.lower()
+                elif eid == 0x9F:  # Channels
+                    info['channels'] = int.from_bytes(payload, 'big')
+                elif eid == 0xB5 and size in (4, 8):  # SamplingFrequency
+                    info['sample_rate'] = int(struct.unpack('>f' if size == 4 else '>d', payload)[0])
+                elif eid == 0xE7:  # Cluster Timecode
+                    state['cluster_tc'] = int.from_bytes(payload, 'big')
+        return last_cluster
+
+    try:
+        last_cluster = walk(0, file_size, skip_sized_clusters=True)
+        if last_cluster and not state['duration_ticks']:
+            state['cluster_tc'] = 0
+            walk(*last_cluster, skip_sized_clusters=False)
+    except (IndexError, ValueError, struct.error):
+        pass  # Truncated or damaged file: keep whatever was read
+
+    ticks = state['duration_ticks'] or state['last_block_tc']
+    if ticks:
+        info['duration'] = ticks * state['timecode_scale'] / 1e9
+    return info
+
+
+# --- M4A / MP4 (ISO BMFF) ---
+# moof/traf/mvex are for fragmented MP4 (MediaRecorder with a timeslice, e.g. Safari),
+# whose mvhd duration is 0: the length comes from mehd or the trun sample durations.
+_MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'mvex', b'moof', b'traf'}
+_MP4_VALUES = {b'mvhd', b'mdhd', b'stsd', b'mehd', b'trex', b'tfhd', b'trun'}  # Boxes whose body we read
+
+
+def _probe_mp4(f, file_size):
+    """Walk box headers, seeking past mdat and anything else we don't read"""
+    info = _empty_info()
+    movie = {'timescale': None, 'duration': None, 'fragment_duration': None,
+             'media_timescale': None, 'trex_default': 0, 'tfhd_default': None, 'trun_total': 0}
+
+    def walk(start, end):
+        pos = start
+        while pos + 8 <= end:
+            f.seek(pos)
+            head = f.read(16)
+            size = struct.unpack('>I', head[:4])[0]
+            box_type = head[4:8]
+            header = 8
+            if size == 1:
+                size = struct.unpack('>Q', head[8:16])[0]
+                header = 16
+            elif size == 0:
+                size = end - pos
+            if size < header:
+                return
+            body, box_end = pos + header, min(pos + size, end)
+
+            if box_type == b'traf':
+                movie['tfhd_default'] = None
+            if box_type in _MP4_CONTAINERS:
+                walk(body, box_end)
+            elif box_type in _MP4_VALUES:
+                f.seek(body)
+                read_box(box_type, f.read(box_end - body))
+            pos = pos + size
+
+    def read_box(box_type, data):
+        version, flags = data[0], int.from_bytes(data[1:4], 'big')
+        if box_type == b'mvhd':
+            if version == 1:
+                timescale, duration = struct.unpack('>IQ', data[20:32])
+            else:
+                timescale, duration = struct.unpack('>II', data[12:20])
+            movie['timescale'] = timescale
+            if duration not in (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+                movie['duration'] = duration
+        elif box_type == b'mdhd':
+            movie['media_timescale'] = struct.unpack('>I', data[20:24] if version == 1 else data[12:16])[0]
+        elif box_type == b'mehd':
+            movie['fragment_duration'] = struct.unpack('>Q' if version == 1 else '>I',
+                                                       data[4:12] if version == 1 else data[4:8])[0]
+        elif box_type == b'trex':
+            movie['trex_default'] = struct.unpack('>I', data[12:16])[0]
+        elif box_type == b'tfhd':
+            pos = 8  # Version/flags + track ID, then optional fields in flag order
+            pos += 8 if flags & 0x01 else 0   # base_data_offset
+            pos += 4 if flags & 0x02 else 0   # sample_description_index
+            if flags & 0x08:
+                movie['tfhd_default'] = struct.unpack('>I', data[pos:pos + 4])[0]
+        elif box_type == b'trun':
+            count = struct.unpack('>I', data[4:8])[0]
+            if flags & 0x100:  # Per-sample durations
+                pos = 8 + (4 if flags & 0x01 else 0) + (4 if flags & 0x04 else 0)
+                stride = 4 * bin(flags & 0xF00).count('1')
+                movie['trun_total'] += sum(
+                    struct.unpack('>I', data[p:p + 4])[0] for p in range(pos, pos + count * stride, stride))
+            else:
+                default = movie['tfhd_default'] if movie['tfhd_default'] is not None else movie['trex_default']
+                movie['trun_total'] += count * default
+        elif box_type == b'stsd' and info['codec'] is None:
+            entry = 8  # Skip version/flags + entry count
+            info['codec'] = data[entry + 4:entry + 8].decode('ascii', 'replace').strip()
+            info['channels'] = struct.unpack('>H', data[entry + 24:entry + 26])[0]
+            info['sample_rate'] = struct.unpack('>I', data[entry + 32:entry + 36])[0] >> 16
+
+    try:
+        walk(0, file_size)
+    except (IndexError, struct.error):
+        pass
+    if movie['timescale'] and movie['duration']:
+        info['duration'] = movie['duration'] / movie['timescale']
+    elif movie['timescale'] and movie['fragment_duration']:
+        info['duration'] = movie['fragment_duration'] / movie['timescale']
+    elif movie['trun_total'] and (movie['media_timescale'] or movie['timescale']):
+        info['duration'] = movie['trun_total'] / (movie['media_timescale'] or movie['timescale'])
+    if info['codec'] == 'mp4a':
+        info['codec'] = 'aac'
+    return info
+
+
+# --- WAV (RIFF) ---
+_WAV_CODECS = {1: 'pcm', 3: 'pcm_float', 6: 'alaw', 7: 'mulaw', 0xFFFE: 'pcm'}
+
+
+def _probe_wav(data, file_size):
+    info = _empty_info()
+    if data[:4] not in (b'RIFF', b'RF64') or data[8:12] != b'WAVE':
+        return info
+    byte_rate = None
+    pos = 12
+    try:
+        while pos + 8 <= len(data):
+            chunk_id = data[pos:pos + 4]
+            size = struct.unpack('<I', data[pos + 4:pos + 8])[0]
+            body = pos + 8
+            if chunk_id == b'fmt ':
+                tag, channels, sample_rate, byte_rate = struct.unpack('<HHII', data[body:body + 12])
+                info['codec'] = _WAV_CODECS.get(tag, f"0x{tag:04x}")
+                info['channels'] = channels
+                info['sample_rate'] = sample_rate
+            elif chunk_id == b'data':
+                # Streamed / RF64 files leave the size unset; use the file size instead
+                if size == 0xFFFFFFFF or body + size > file_size:
+                    size = file_size - body
+                if byte_rate:
+                    info['duration'] = size / byte_rate
+                break
+            pos = body + size + (size & 1)
+    except struct.error:
+        pass
+    return info
+
+
+# --- MP3 (MPEG audio Layer III) ---
+_MP3_BITRATES = {
+    'v1': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    'v2': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _probe_mp3(data, file_size):
+    info = _empty_info()
+    pos = 0
+    if data[:3] == b'ID3' and len(data) >= 10:
+        tag_size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + tag_size + (10 if data[5] & 0x10 else 0)
+
+    # Find the first valid Layer III frame header
+    while pos + 4 <= len(data):
+        if data[pos] == 0xFF and data[pos + 1] & 0xE0 == 0xE0:
+            version = (data[pos + 1] >> 3) & 3
+            layer = (data[pos + 1] >> 1) & 3
+            bitrate_idx = data[pos + 2] >> 4
+            sr_idx = (data[pos + 2] >> 2) & 3
+            if version != 1 and layer == 1 and 0 < bitrate_idx < 15 and sr_idx < 3:
+                break
+        pos += 1
+    else:
+        return info
+
+    mono = (data[pos + 3] >> 6) == 3
+    bitrate = _MP3_BITRATES['v1' if version == 3 else 'v2'][bitrate_idx] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sr_idx]
+    samples_per_frame = 1152 if version == 3 else 576
+    info.update({'codec': 'mp3', 'channels': 1 if mono else 2, 'sample_rate': sample_rate})
+
+    # VBR files carry a Xing/Info header with the frame count
+    side_info = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+    xing = pos + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info') and len(data) >= xing + 12:
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack('>I', data[xing + 8:xing + 12])[0]
+            info['duration'] = frames * samples_per_frame / sample_rate
+            return info
+
+    # Otherwise assume constant bitrate
+    info['duration'] = (file_size - pos) * 8 / bitrate
+    return info
+
+
+def probe_audio(file_path):
+    """Read codec, duration (seconds), channels and sample rate from the file header"""
+    ext = os.path.splitext(file_path)[1].lower()
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        # WebM / MP4 are walked in place (seeking over audio data); WAV / MP3 need only the head
+        if ext == '.webm':
+            return _probe_webm(f, file_size)
+        if ext in ('.m4a', '.mp4'):
+            return _probe_mp4(f, file_size)
+        if ext == '.wav':
+            return _probe_wav(f.read(HEAD_BYTES), file_size)
+        if ext == '.mp3':
+            return _probe_mp3(f.read(HEAD_BYTES), file_size)
+    return _empty_info()
+
+
+def read_init_segment(file_path):
+    """
+    Container header of a MediaRecorder recording: the WebM bytes before the
+    first Cluster, or the fragmented MP4 bytes (ftyp + moov) before the first moof.
+    Later timeslice segments carry no header of their own; prefixed with this
+    they decode on their own. Returns None for other formats.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        try:
+            pos = 0
+            if ext == '.webm':
+                while pos < file_size:
+                    eid, size, unknown, body = _read_ebml_header(f, pos)
+                    if eid == _EBML_CLUSTER:
+                        break
+                    if eid == 0x18538067 or unknown:  # Step into the Segment
+                        pos = body
+                    else:
+                        pos = body + size
+                else:
+                    return None
+            elif ext in ('.m4a', '.mp4'):
+                has_moov = False
+                while pos + 8 <= file_size:
+                    f.seek(pos)
+                    head = f.read(16)
+                    size = struct.unpack('>I', head[:4])[0]
+                    if head[4:8] in (b'moof', b'mdat'):
+                        break
+                    has_moov = has_moov or head[4:8] == b'moov'
+                    if size == 1:
+                        size = struct.unpack('>Q', head[8:16])[0]
+                    if size < 8:
+                        return None
+                    pos += size
+                else:
+                    return None
+                if not has_moov:
+                    return None
+            else:
+                return None
+        except (IndexError, ValueError, struct.error):
+            return None
+        f.seek(0)
+        return f.read(pos)
+
+
+# ======== Persistent index ========
+
+class MetadataIndex:
+    """Metadata for every recording seen, keyed by "<folder>/<filename>" """
+
+    def __init__(self, index_file=METADATA_FILE):
+        self.index_file = index_file
+        self.files = {}
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    self.files = json.load(f).get('files', {})
+            except Exception:
+                self.files = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files}, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+
+    def get(self, folder_id, filename):
+        return self.files.get(f"{folder_id}/{filename}")
+
+    def update(self, file_path, folder_id):
+        """Index a file (re-probing only if its size or mtime changed) and return its record"""
+        filename = os.path.basename(file_path)
+        key = f"{folder_id}/{filename}"
+        stat = os.stat(file_path)
+        record = self.files.get(key)
+        if record and record['size'] == stat.st_size and record['mtime'] == int(stat.st_mtime):
+            return record
+
+        parsed = parse_filename(filename)
+        record = {
+            'folder': folder_id,
+            'filename': filename,
+            'kind': parsed['kind'] if parsed else None,
+            'recorded_at': parsed['recorded_at'].strftime("%Y-%m-%d %H:%M:%S") if parsed else None,
+            'size': stat.st_size,
+            'mtime': int(stat.st_mtime),
+        }
+        if filename.lower().endswith('.txt'):
+            record.update(_empty_info())
+        else:
+            record.update(probe_audio(file_path))
+        self.files[key] = record
+        return record
+
+    def query(self, folder_id=None, kind=None, since=None, until=None):
+        """Records matching the filters, oldest first. since/until compare as 'YYYY-MM-DD[ HH:MM:SS]'."""
+        results = []
+        for record in self.files.values():
+            recorded_at = record.get('recorded_at') or ''
+            if folder_id and record['folder'] != folder_id:
+                continue
+            if kind and record['kind'] != kind:
+                continue
+            if since and recorded_at < since:
+                continue
+            if until and recorded_at >= until:
+                continue
+            results.append(record)
+        results.sort(key=lambda r: (r.get('recorded_at') or '', r['filename']))
+        return results
+
+
+def main():
+    folder_id = sys.argv[1] if len(sys.argv) > 1 else None
+    index = MetadataIndex()
+    records = index.query(folder_id=folder_id)
+    if not records:
+        print("No recordings indexed yet")
+        return
+
+    by_folder = {}
+    for r in records:
+        by_folder.setdefault(r['folder'], []).append(r)
+    for folder, items in sorted(by_folder.items()):
+        audio = [r for r in items if r['kind'] == 'recording']
+        total_sec = sum(r['duration'] or 0 for r in audio)
+        codecs = sorted({r['codec'] for r in audio if r['codec']})
+        print(f"[{folder}] {len(audio)} recording(s), {len(items) - len(audio)} text input(s), "
+              f"{total_sec / 60:.1f} min audio, codecs: {', '.join(codecs) or '-'}")
+        print(f"    {items[0]['recorded_at']} -> {items[-1]['recorded_at']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,17 +3,25 @@ Voice Recorder Sync & Process
 - Pulls new recordings from GitHub
 - Transcribes using local Whisper
 - Uploads transcriptions to a single Google Doc (with volume management)
+- Archives transcripts locally with a full-text index (see transcript_archive.py)
 - Cleans up processed audio files
+- Marks each appended entry with a named range and journals appends, so a
+  crashed run is reconciled on the next start instead of appending twice
+
+Usage:
+    python backend/sync_and_process.py [--profile]
 """
 import os
 import sys
+import re
 import glob
 import json
 import time
 import random
+import shutil
 import subprocess
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Setup path for Util imports
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -27,13 +35,12 @@ from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-# Import transcriber
-try:
-    from multimedia_to_text import WhisperTranscriber
-    transcriber_instance = WhisperTranscriber()
-except ImportError as e:
-    print(f"Error importing WhisperTranscriber: {e}")
-    transcriber_instance = None
+from transcript_archive import TranscriptArchive
+from recording_metadata import MetadataIndex, read_init_segment
+from sync_logging import setup_logging, log_stage
+
+# Transcriber is loaded on first use, so helpers can be imported without loading Whisper
+transcriber_instance = None
 
 # ======== Configuration ========
 GDRIVE_FOLDER_ID = '1c6IZkrEqOQnzF3hyByxQGYgyVyeUfxsu'
@@ -41,11 +48,19 @@ CREDENTIALS_PATH = os.path.join(current_dir, 'credential', 'key.json')
 RECORDINGS_DIR = os.path.join(project_root, 'recordings')
 LOG_DIR = os.path.join(project_root, 'logs')
 STATE_FILE = os.path.join(LOG_DIR, 'processed_state.json')
+JOURNAL_FILE = os.path.join(LOG_DIR, 'sync_journal.jsonl')
 FOLDERS_CONFIG_FILE = os.path.join(project_root, 'folders.json')
+SEGMENT_CACHE_DIR = os.path.join(LOG_DIR, 'segments')
 
 # Document Settings
 DOC_BASE_NAME = "Voice Transcripts"
 MAX_DOC_SIZE = 800000  # ~800K characters per document (Google Docs limit is ~1M)
+MARKER_PREFIX = 'vr:'  # Named range on each entry: "vr:<folder>/<filename>"
+
+# Segmented uploads: recording_<ts>.part0001.webm ... recording_<ts>.part0007-end.webm
+SEGMENT_RE = re.compile(r'^(recording_.+)\.part(\d{4})(-end)?(\.\w+)$')
+STALE_SEGMENT_HOURS = 12  # Assemble an incomplete set if no new part was pushed for this long
+SEGMENT_SECONDS = 120  # Length of one segment (SEGMENT_MS in index.html)
 
 # API Settings
 BASE_INTERVAL = 2.0
@@ -54,14 +69,7 @@ JITTER_RANGE = (0.8, 1.2)
 
 # Logging
 os.makedirs(LOG_DIR, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(LOG_DIR, 'sync_process.log'), encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+setup_logging(LOG_DIR, 'sync_process')
 
 
 class GoogleDocManager:
@@ -141,8 +149,21 @@ class GoogleDocManager:
             logging.error(f"Failed to create document: {e}")
             return None
 
-    def append_content(self, doc_id, content):
-        """Append content to the end of a document"""
+    def get_markers(self, doc_id):
+        """Return the entry marker names in a document (reads named ranges only, not the body)"""
+        try:
+            doc = self._rate_limited_call(
+                self.docs_service.documents().get,
+                documentId=doc_id,
+                fields='namedRanges'
+            )
+            return {name for name in doc.get('namedRanges', {}) if name.startswith(MARKER_PREFIX)}
+        except Exception as e:
+            logging.error(f"Failed to read markers: {str(e)[:100]}")
+            return None
+
+    def append_content(self, doc_id, content, marker=None):
+        """Append content to the end of a document, optionally tagging it with a named range"""
         if not content.strip():
             return True
             
@@ -168,6 +189,17 @@ class GoogleDocManager:
                 }]
             }
             
+            if marker:
+                # Same batchUpdate as the insert, so the entry and its marker land together.
+                # Docs indexes count UTF-16 code units.
+                length = len(content.encode('utf-16-le')) // 2
+                requests_body['requests'].append({
+                    'createNamedRange': {
+                        'name': marker,
+                        'range': {'startIndex': end_index, 'endIndex': end_index + length}
+                    }
+                })
+            
             if revision_id:
                 requests_body['writeControl'] = {'targetRevisionId': revision_id}
             
@@ -244,11 +276,118 @@ def load_state():
 
 def save_state(state):
     os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
-    with open(STATE_FILE, 'w', encoding='utf-8') as f:
+    # Write-then-rename so a crash never leaves a half-written state file
+    tmp_file = STATE_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
         json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_file, STATE_FILE)
+
+
+def entry_marker(folder_id, filename):
+    return f"{MARKER_PREFIX}{folder_id}/{filename}"
+
+
+def journal(event, **fields):
+    """Append an event to the sync journal (flushed to disk immediately)"""
+    record = {'time': datetime.now().isoformat(timespec='seconds'), 'event': event}
+    record.update(fields)
+    with open(JOURNAL_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_journal():
+    records = []
+    if os.path.exists(JOURNAL_FILE):
+        with open(JOURNAL_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass  # Torn last line from a crash
+    return records
+
+
+def start_journal(records, unresolved=()):
+    """
+    Compact the journal to the last clean shutdown and open a new run.
+    Unresolved append_begin records are carried over so a later run can still settle them.
+    """
+    last_clean = [r for r in records if r['event'] == 'clean_shutdown'][-1:]
+    with open(JOURNAL_FILE, 'w', encoding='utf-8') as f:
+        for r in last_clean + list(unresolved):
+            f.write(json.dumps(r, ensure_ascii=False) + '\n')
+    journal('run_start')
+
+
+def recover_pending_appends(gdocs, state, records):
+    """
+    Reconcile appends that started but were never confirmed (crash between
+    append_content and save_state, or an append that errored after the
+    server applied it). Reads each affected document's named ranges once.
+    Returns (source files of recovered entries to clean up, append_begin
+    records that could not be checked because the document was unreadable).
+    """
+    pending = {}
+    for r in records:
+        key = (r.get('folder'), r.get('file'))
+        if r['event'] == 'append_begin':
+            pending[key] = r
+        elif r['event'] == 'append_done':
+            pending.pop(key, None)
+    
+    if records and records[-1]['event'] != 'clean_shutdown':
+        last_clean = next((r['time'] for r in reversed(records) if r['event'] == 'clean_shutdown'), 'never')
+        logging.warning(f"Previous run did not shut down cleanly (last clean shutdown: {last_clean})")
+    if not pending:
+        return [], []
+    
+    logging.info(f"Recovering {len(pending)} unconfirmed append(s)...")
+    by_doc = {}
+    for r in pending.values():
+        by_doc.setdefault(r['doc'], []).append(r)
+    
+    recovered_paths = []
+    unresolved = []
+    for doc_id, entries in by_doc.items():
+        markers = gdocs.get_markers(doc_id)
+        if markers is None:
+            # Can't tell whether these landed: hold them back rather than risk a duplicate
+            logging.warning(f"Could not read markers of {doc_id}, holding back {len(entries)} file(s) until next run")
+            unresolved.extend(entries)
+            continue
+        for r in entries:
+            folder_state = state['folders'].setdefault(r['folder'], {
+                'processed_files': [], 'current_doc': None, 'volume': 1
+            })
+            if entry_marker(r['folder'], r['file']) not in markers:
+                logging.info(f"Not in document, will reprocess: {r['file']}")
+                continue
+            if r['file'] not in folder_state['processed_files']:
+                folder_state['processed_files'].append(r['file'])
+            record_segments(folder_state, r.get('paths', []))
+            recovered_paths.extend(os.path.join(project_root, p) for p in r.get('paths', []))
+            logging.info(f"Recovered: {r['file']} was already appended")
+    
+    save_state(state)
+    return [p for p in recovered_paths if os.path.exists(p)], unresolved
+
+
+def get_transcriber():
+    """Load WhisperTranscriber once per process"""
+    global transcriber_instance
+    if transcriber_instance is None:
+        try:
+            from multimedia_to_text import WhisperTranscriber
+            transcriber_instance = WhisperTranscriber()
+        except ImportError as e:
+            logging.error(f"Error importing WhisperTranscriber: {e}")
+    return transcriber_instance
 
 
 def transcribe_audio(file_path):
+    transcriber_instance = get_transcriber()
     if not transcriber_instance:
         logging.error("Transcriber instance is None! Initialization must have failed.")
         return None
@@ -263,6 +402,115 @@ def transcribe_audio(file_path):
     return None
 
 
+def segment_upload_time(paths):
+    """Commit time of the newest of these files (file mtime if git can't tell)"""
+    rel_paths = [os.path.relpath(p, project_root) for p in paths]
+    out = run_git_command(['log', '-1', '--format=%ct', '--'] + rel_paths)
+    if out:
+        return int(out)
+    return max(os.path.getmtime(p) for p in paths)
+
+
+def record_segments(folder_state, paths):
+    """Remember the highest part number of each segment set that has been appended"""
+    consumed = folder_state.setdefault('segment_parts', {})
+    for path in paths:
+        m = SEGMENT_RE.match(os.path.basename(path))
+        if m:
+            merged_name = m.group(1) + m.group(4)
+            consumed[merged_name] = max(consumed.get(merged_name, 0), int(m.group(2)))
+
+
+def assemble_segments(folder_path, processed_set, consumed):
+    """
+    Concatenate uploaded recording segments back into whole files.
+    consumed maps each set to the highest part number already appended.
+    Returns ({merged_path: [segment paths]}, [orphaned segment paths]).
+    A set is assembled once it is complete (an -end part and no gaps) or stale;
+    other sets wait for the next run. A stale set without part0001 keeps waiting,
+    since the container header lives in that part.
+    
+    Parts that arrive after their set was processed (e.g. queued offline on the
+    phone) become a continuation entry named after their first part, prefixed
+    with the header saved from part0001. Parts at or below the consumed number
+    (left behind when a run stopped before cleanup) and late parts with no saved
+    header are returned as orphaned so they can be removed.
+    """
+    groups = {}
+    for name in os.listdir(folder_path):
+        m = SEGMENT_RE.match(name)
+        if m:
+            part = (int(m.group(2)), bool(m.group(3)), os.path.join(folder_path, name))
+            groups.setdefault(m.group(1) + m.group(4), []).append(part)
+    
+    merged = {}
+    orphaned = []
+    for merged_name, parts in groups.items():
+        parts.sort()
+        last_consumed = consumed.get(merged_name, 0)
+        if merged_name in processed_set and not last_consumed:
+            last_consumed = float('inf')  # Processed before parts were tracked: can't tell which are new
+        leftover = [path for num, _, path in parts if num <= last_consumed]
+        if leftover:
+            logging.info(f"Removing {len(leftover)} already processed segment(s) of {merged_name}")
+            orphaned.extend(leftover)
+        parts = [part for part in parts if part[0] > last_consumed]
+        if not parts:
+            continue
+        numbers = [num for num, _, _ in parts]
+        paths = [path for _, _, path in parts]
+        header_path = os.path.join(SEGMENT_CACHE_DIR, merged_name + '.init')
+        
+        continuation = last_consumed > 0
+        if continuation:
+            base, ext = os.path.splitext(merged_name)
+            out_name = f"{base}.part{numbers[0]:04d}{ext}"
+            if out_name in processed_set:
+                continue
+        else:
+            out_name = merged_name
+        
+        complete = parts[-1][1] and numbers == list(range(numbers[0], numbers[0] + len(parts)))
+        if not continuation and numbers[0] != 1:
+            complete = False
+        if not complete:
+            age = time.time() - segment_upload_time(paths)
+            if age < STALE_SEGMENT_HOURS * 3600:
+                logging.info(f"Waiting for remaining segments of {out_name} ({len(parts)} so far)")
+                continue
+            if not continuation and numbers[0] != 1:
+                logging.warning(f"Segment set {merged_name} has no part0001 (no container header), still waiting")
+                continue
+            logging.warning(f"Assembling incomplete segment set {out_name} (parts {numbers})")
+        
+        header = b''
+        if continuation:
+            if not os.path.exists(header_path):
+                logging.warning(f"Late segment(s) {numbers} of processed {merged_name} have no saved header, removing")
+                orphaned.extend(paths)
+                continue
+            with open(header_path, 'rb') as f:
+                header = f.read()
+            logging.info(f"Late segment(s) {numbers} of {merged_name} will be added as a continuation")
+        
+        os.makedirs(SEGMENT_CACHE_DIR, exist_ok=True)
+        if not continuation and not complete:
+            # Keep part0001's header in case the missing parts still arrive later
+            init_segment = read_init_segment(paths[0])
+            if init_segment:
+                with open(header_path, 'wb') as f:
+                    f.write(init_segment)
+        
+        merged_path = os.path.join(SEGMENT_CACHE_DIR, out_name)
+        with open(merged_path, 'wb') as dst:
+            dst.write(header)
+            for path in paths:
+                with open(path, 'rb') as src:
+                    shutil.copyfileobj(src, dst)
+        merged[merged_path] = paths
+    return merged, orphaned
+
+
 def format_transcript(recording_time, content):
     """
     Compact transcript format.
@@ -316,6 +564,7 @@ def get_or_create_doc(gdocs, folder_state, folder_name='Voice'):
     if new_id:
         folder_state['current_doc'] = new_id
         folder_state['volume'] = volume
+        return new_id, doc_name, 1
     
     return None, None, 0
 
@@ -326,7 +575,8 @@ def main():
     
     # 1. Git Pull
     logging.info("Pulling latest from GitHub...")
-    run_git_command(['pull'])
+    with log_stage('git_pull'):
+        run_git_command(['pull'])
     
     # 2. Load folder configuration
     folders = load_folder_config()
@@ -345,8 +595,21 @@ def main():
         logging.error("Please place your Google API key.json in backend/credential/")
         return
     
-    files_to_delete = []
+    # Local searchable archive (failures here must never block the sync)
+    try:
+        archive = TranscriptArchive()
+    except Exception as e:
+        logging.warning(f"Transcript archive unavailable: {e}")
+        archive = None
+    
+    # Reconcile anything a crashed run left half-done, then start a fresh journal
+    journal_records = read_journal()
+    files_to_delete, unresolved = recover_pending_appends(gdocs, state, journal_records)
+    start_journal(journal_records, unresolved)
+    held_back = {(r['folder'], r['file']) for r in unresolved}
+    
     total_processed = 0
+    metadata = MetadataIndex()
     
     # 5. Process each folder
     for folder in folders:
@@ -369,6 +632,8 @@ def main():
         
         folder_state = state['folders'][folder_id]
         processed_set = set(folder_state.get('processed_files', []))
+        # Files whose earlier append could not be confirmed wait until it can be checked
+        held_set = {name for f_id, name in held_back if f_id == folder_id}
         
         # Find new audio files and text files in this folder
         extensions = ['*.webm', '*.m4a', '*.wav', '*.mp3', '*.txt']
@@ -376,7 +641,16 @@ def main():
         for ext in extensions:
             pattern = os.path.join(folder_path, ext)
             found_files = glob.glob(pattern)
-            new_files.extend([f for f in found_files if os.path.basename(f) not in processed_set])
+            new_files.extend([f for f in found_files
+                              if os.path.basename(f) not in processed_set
+                              and os.path.basename(f) not in held_set
+                              and not SEGMENT_RE.match(os.path.basename(f))])
+        
+        # Segmented recordings are merged into one file each before transcription
+        segments, orphaned = assemble_segments(folder_path, processed_set, folder_state.get('segment_parts', {}))
+        segments = {p: parts for p, parts in segments.items() if os.path.basename(p) not in held_set}
+        new_files.extend(segments.keys())
+        files_to_delete.extend(p for p in orphaned if p not in files_to_delete)
         
         if not new_files:
             logging.info(f"No new files in folder '{folder_id}'")
@@ -384,25 +658,34 @@ def main():
         
         logging.info(f"Found {len(new_files)} new file(s) in folder '{folder_id}'")
         
+        # Index filename timestamps and audio headers, then process in recording order
+        file_meta = {f: metadata.update(f, folder_id) for f in new_files}
+        metadata.save()
+        ordered = sorted(new_files, key=lambda f: (file_meta[f]['recorded_at'] or '', os.path.basename(f)))
+        
         # Process files in this folder
-        for audio_file in sorted(new_files):
+        for audio_file in ordered:
             filename = os.path.basename(audio_file)
-            logging.info(f"Processing [{folder_id}]: {filename}")
-            
-            # Check if this is a text file or audio file
+            meta = file_meta[audio_file]
             is_text_file = filename.lower().endswith('.txt')
             
-            # Extract timestamp from filename
-            try:
-                if is_text_file:
-                    # text_input_YYYY-MM-DDTHH-MM-SS-SSSZ.txt
-                    ts_part = filename.replace('text_input_', '').replace('.txt', '')
-                else:
-                    # recording_YYYY-MM-DDTHH-MM-SS-SSSZ.webm
-                    ts_part = filename.replace('recording_', '').replace('.webm', '').replace('.m4a', '').replace('.wav', '').replace('.mp3', '')
-                recording_time = ts_part.replace('T', ' ').replace('-', ':', 2).replace('-', ':').rsplit(':', 1)[0].replace(':', '-', 2)
-            except:
-                recording_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            fields = {'folder': folder_id, 'file': filename}
+            if is_text_file or meta['duration'] is None:
+                logging.info(f"Processing [{folder_id}]: {filename}", extra=fields)
+            else:
+                logging.info(f"Processing [{folder_id}]: {filename} ({meta['duration']:.1f}s {meta['codec']})",
+                             extra=fields)
+            
+            recording_time = meta['recorded_at']
+            if not recording_time:
+                recording_time = datetime.fromtimestamp(os.path.getmtime(audio_file)).strftime("%Y-%m-%d %H:%M:%S")
+                logging.warning(f"Unrecognized filename {filename}, using file time {recording_time}")
+            
+            segment = SEGMENT_RE.match(filename)
+            if segment:
+                # Continuation of an earlier set: starts (part - 1) segments into the recording
+                offset = timedelta(seconds=(int(segment.group(2)) - 1) * SEGMENT_SECONDS)
+                recording_time = (datetime.strptime(recording_time, "%Y-%m-%d %H:%M:%S") + offset).strftime("%Y-%m-%d %H:%M:%S")
             
             # Get content: transcribe audio OR read text file
             if is_text_file:
@@ -418,14 +701,21 @@ def main():
                     text = "[Error reading text file]"
             else:
                 # Transcribe audio
-                text = transcribe_audio(audio_file)
+                with log_stage('transcribe', **fields):
+                    text = transcribe_audio(audio_file)
                 if not text or not text.strip():
-                    logging.warning(f"Empty transcription for {filename}")
+                    logging.warning(f"Empty transcription for {filename}", extra=fields)
                     text = "[No speech detected]"
             
             # Format content
             transcript_entry = format_transcript(recording_time, text.strip())
             
+            if archive:
+                try:
+                    archive.add(folder_id, recording_time, filename, text.strip())
+                except Exception as e:
+                    logging.warning(f"Failed to archive {filename}: {e}")
+            
             # Get or create document for this folder
             doc_id, doc_name, current_size = get_or_create_doc(gdocs, folder_state, folder_name)
             
@@ -443,35 +733,85 @@ def main():
                     logging.error("Failed to create new volume, skipping file")
                     continue
             
-            # Append to document
-            if gdocs.append_content(doc_id, transcript_entry):
+            # Append to document (journaled, so a crash here can be reconciled)
+            sources = segments.get(audio_file, [audio_file])
+            journal('append_begin', folder=folder_id, file=filename, doc=doc_id,
+                    paths=[os.path.relpath(p, project_root) for p in sources])
+            with log_stage('append', **fields):
+                appended = gdocs.append_content(doc_id, transcript_entry, marker=entry_marker(folder_id, filename))
+            if appended:
                 folder_state['processed_files'].append(filename)
+                record_segments(folder_state, sources)
                 save_state(state)
-                files_to_delete.append(audio_file)
+                journal('append_done', folder=folder_id, file=filename)
+                files_to_delete.extend(sources)
+                if audio_file in segments:
+                    os.remove(audio_file)
                 total_processed += 1
-                logging.info(f"✅ Added to '{doc_name}'")
+                logging.info(f"✅ Added to '{doc_name}'", extra=fields)
             else:
-                logging.error(f"❌ Failed to append: {filename}")
+                logging.error(f"❌ Failed to append: {filename}", extra=fields)
+    
+    if archive:
+        archive.close()
     
     # 6. Clean up - delete processed audio files from GitHub
     if files_to_delete:
         logging.info(f"Cleaning up {len(files_to_delete)} processed audio file(s) from GitHub...")
-        for f in files_to_delete:
-            rel_path = os.path.relpath(f, project_root)
-            run_git_command(['rm', rel_path])
-        
-        run_git_command(['commit', '-m', f'Processed {len(files_to_delete)} audio file(s)'])
-        push_result = run_git_command(['push'])
+        with log_stage('cleanup'):
+            for f in files_to_delete:
+                rel_path = os.path.relpath(f, project_root)
+                run_git_command(['rm', rel_path])
+            
+            run_git_command(['commit', '-m', f'Processed {len(files_to_delete)} audio file(s)'])
+            push_result = run_git_command(['push'])
         
         if push_result is not None:
             logging.info(f"✅ Deleted {len(files_to_delete)} audio file(s) from GitHub")
         else:
             logging.warning("Failed to push deletions to GitHub")
     
+    journal('clean_shutdown', processed=total_processed)
+    
     logging.info("=" * 50)
     logging.info(f"Done! Processed {total_processed} recording(s)")
     logging.info(f"View transcriptions: https://drive.google.com/drive/folders/{GDRIVE_FOLDER_ID}")
 
 
+def enable_profiling():
+    """Wrap the pipeline stages in a RunProfiler (only called with --profile)"""
+    from profiling import RunProfiler
+    profiler = RunProfiler('sync')
+    profiler.instrument(sys.modules[__name__], {
+        'main': 'main',
+        'run_git_command': 'git',
+        'load_folder_config': 'state',
+        'load_state': 'state',
+        'save_state': 'state',
+        'journal': 'journal',
+        'recover_pending_appends': 'recovery',
+        'assemble_segments': 'segments',
+        'transcribe_audio': 'transcribe',
+        'get_or_create_doc': 'doc_lookup',
+    })
+    profiler.instrument(GoogleDocManager, {
+        '__init__': 'gdocs_init',
+        'find_doc_by_name': 'gdocs_find',
+        'get_doc_size': 'gdocs_size',
+        'create_document': 'gdocs_create',
+        'append_content': 'gdocs_append',
+        'get_markers': 'gdocs_markers',
+    })
+    profiler.instrument(MetadataIndex, {'update': 'metadata', 'save': 'metadata'})
+    profiler.instrument(TranscriptArchive, {'add': 'archive'})
+    return profiler
+
+
 if __name__ == "__main__":
-    main()
+    profiler = enable_profiling() if '--profile' in sys.argv[1:] else None
+    try:
+        with log_stage('run'):
+            main()
+    finally:
+        if profiler:
+            profiler.finish()
@@ -0,0 +1,126 @@
+"""
+Sync Logging
+- Non-blocking: handlers run on a background thread fed by a queue
+- JSON-lines log file with size-based rotation; rotated files are gzip-compressed
+- Structured fields (folder, file, stage, duration) via `extra=` or log_stage()
+"""
+import os
+import json
+import gzip
+import time
+import queue
+import shutil
+import atexit
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# ======== Configuration ========
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Rotate at 5 MB
+LOG_BACKUP_COUNT = 10            # Keep <name>.jsonl.1.gz ... .10.gz
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+STRUCTURED_FIELDS = ('folder', 'file', 'stage', 'duration')
+
+_handlers = []  # Console / file handlers of this process, shared with pool workers
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any structured fields set on the record"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+def _gzip_namer(name):
+    return name + '.gz'
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def setup_logging(log_dir, name, level=logging.INFO):
+    """
+    Route the root logger through a queue to a rotating JSON file and the console.
+    Worker processes (e.g. backfill's pool) never open the log file, so a single
+    process owns it and its rotation; pool workers should log through
+    worker_log_queue() / init_worker_logging() instead.
+    """
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    handlers = [console]
+
+    if multiprocessing.parent_process() is None:
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = RotatingFileHandler(
+            os.path.join(log_dir, f"{name}.jsonl"),
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding='utf-8'
+        )
+        file_handler.namer = _gzip_namer
+        file_handler.rotator = _gzip_rotator
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    _handlers[:] = handlers
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers[:] = [QueueHandler(log_queue)]
+
+    listener.start()
+    atexit.register(listener.stop)  # Drain the queue on exit
+    return listener
+
+
+
+def worker_log_queue():
+    """
+    A multiprocessing queue drained into this process's handlers. Pass it to
+    init_worker_logging() from a pool initializer: forked workers inherit a
+    QueueHandler whose listener thread only runs in the parent, so their
+    records would otherwise be lost.
+    """
+    log_queue = multiprocessing.Queue()
+    listener = QueueListener(log_queue, *_handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return log_queue
+
+
+def init_worker_logging(log_queue, level=logging.INFO):
+    """Pool initializer: send this worker's records to the parent's handlers"""
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers[:] = [QueueHandler(log_queue)]
+
+
+@contextmanager
+def log_stage(stage, **fields):
+    """Time a pipeline stage and log its duration as a structured record"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        logging.info(
+            f"{stage} finished in {duration:.2f}s",
+            extra=dict(fields, stage=stage, duration=round(duration, 3))
+        )
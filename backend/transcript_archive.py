@@ -0,0 +1,229 @@
+"""
+Local Transcript Archive
+- Keeps every transcript in an append-only JSONL file per folder
+- Indexes entries in SQLite FTS5 for fast full-text search (no API calls)
+- CJK characters are indexed one per token, so Chinese phrases match as substrings
+
+Usage:
+    python backend/transcript_archive.py search <query> [--folder ID] [--since DATE] [--until DATE] [--limit N]
+    python backend/transcript_archive.py rebuild
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+# ======== Configuration ========
+ARCHIVE_DIR = os.path.join(project_root, 'archive')
+INDEX_FILE = os.path.join(ARCHIVE_DIR, 'index.sqlite3')
+
+SNIPPET_CHARS = 160
+
+# CJK ideographs, kana and hangul: each character becomes its own token
+_CJK_RE = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    folder TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    source TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    UNIQUE (folder, source)
+);
+CREATE INDEX IF NOT EXISTS entries_time ON entries (folder, recorded_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(body, content='');
+"""
+
+
+def _segment(text):
+    """Split CJK runs into single-character tokens for the unicode61 tokenizer"""
+    return _CJK_RE.sub(r' \1 ', text)
+
+
+def _build_match(query):
+    """Turn a free-text query into an FTS5 MATCH expression (all terms must match)"""
+    terms = []
+    for term in query.split():
+        tokens = _segment(term).split()
+        if tokens:
+            phrase = ' '.join(tokens).replace('"', '""')
+            terms.append(f'"{phrase}"')
+    return ' AND '.join(terms)
+
+
+def archive_path(folder_id):
+    return os.path.join(ARCHIVE_DIR, f"{folder_id}.jsonl")
+
+
+class TranscriptArchive:
+    def __init__(self, index_file=INDEX_FILE):
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        self.conn = sqlite3.connect(index_file)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def has_entry(self, folder_id, source):
+        row = self.conn.execute(
+            "SELECT 1 FROM entries WHERE folder = ? AND source = ?",
+            (folder_id, source)
+        ).fetchone()
+        return row is not None
+
+    def _index(self, folder_id, recorded_at, source, text, offset, length):
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO entries (folder, recorded_at, source, offset, length) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (folder_id, recorded_at, source, offset, length)
+        )
+        if cur.rowcount:
+            self.conn.execute(
+                "INSERT INTO entries_fts (rowid, body) VALUES (?, ?)",
+                (cur.lastrowid, _segment(text))
+            )
+
+    def add(self, folder_id, recorded_at, source, text):
+        """Append one transcript to the folder archive and index it. Returns False if already archived."""
+        if self.has_entry(folder_id, source):
+            return False
+
+        line = json.dumps(
+            {'time': recorded_at, 'source': source, 'text': text},
+            ensure_ascii=False
+        ).encode('utf-8') + b'\n'
+
+        with open(archive_path(folder_id), 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(line)
+
+        with self.conn:
+            self._index(folder_id, recorded_at, source, text, offset, len(line))
+        return True
+
+    def rebuild(self):
+        """Recreate the index from the JSONL archives on disk"""
+        with self.conn:
+            self.conn.execute("DROP TABLE IF EXISTS entries_fts")
+            self.conn.execute("DROP TABLE IF EXISTS entries")
+            self.conn.executescript(_SCHEMA)
+
+            total = 0
+            for name in sorted(os.listdir(ARCHIVE_DIR)):
+                if not name.endswith('.jsonl'):
+                    continue
+                folder_id = name[:-len('.jsonl')]
+                offset = 0
+                with open(os.path.join(ARCHIVE_DIR, name), 'rb') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            self._index(folder_id, entry['time'], entry['source'],
+                                        entry['text'], offset, len(line))
+                            total += 1
+                        except (ValueError, KeyError):
+                            pass  # Skip a torn trailing line
+                        offset += len(line)
+        return total
+
+    def search(self, query, folder_id=None, since=None, until=None, limit=20):
+        """Return matching entries, newest first"""
+        match = _build_match(query)
+        if not match:
+            return []
+
+        sql = ("SELECT e.folder, e.recorded_at, e.source, e.offset, e.length "
+               "FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid "
+               "WHERE entries_fts MATCH ?")
+        params = [match]
+        if folder_id:
+            sql += " AND e.folder = ?"
+            params.append(folder_id)
+        if since:
+            sql += " AND e.recorded_at >= ?"
+            params.append(since)
+        if until:
+            sql += " AND e.recorded_at < ?"
+            params.append(until)
+        sql += " ORDER BY e.recorded_at DESC LIMIT ?"
+        params.append(limit)
+
+        results = []
+        handles = {}
+        try:
+            for folder, recorded_at, source, offset, length in self.conn.execute(sql, params):
+                if folder not in handles:
+                    handles[folder] = open(archive_path(folder), 'rb')
+                f = handles[folder]
+                f.seek(offset)
+                entry = json.loads(f.read(length))
+                results.append({
+                    'folder': folder,
+                    'time': recorded_at,
+                    'source': source,
+                    'text': entry['text'],
+                })
+        finally:
+            for f in handles.values():
+                f.close()
+        return results
+
+
+def make_snippet(text, query, width=SNIPPET_CHARS):
+    """Cut a window of text around the first query term"""
+    text = ' '.join(text.split())
+    pos = -1
+    for term in query.split():
+        pos = text.lower().find(term.lower())
+        if pos >= 0:
+            break
+    if len(text) <= width:
+        return text
+    start = max(0, min(pos, len(text) - width) - width // 4) if pos >= 0 else 0
+    snippet = text[start:start + width]
+    return ('...' if start else '') + snippet + ('...' if start + width < len(text) else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the local transcript archive")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    search_p = sub.add_parser('search', help="Full-text search across archived transcripts")
+    search_p.add_argument('query')
+    search_p.add_argument('--folder', help="Limit to one folder id (e.g. LifeVoice)")
+    search_p.add_argument('--since', help="Earliest recording time, e.g. 2025-12-01")
+    search_p.add_argument('--until', help="Latest recording time (exclusive), e.g. 2026-01-01")
+    search_p.add_argument('--limit', type=int, default=20)
+
+    sub.add_parser('rebuild', help="Rebuild the search index from the JSONL archives")
+
+    args = parser.parse_args()
+    archive = TranscriptArchive()
+    try:
+        if args.command == 'rebuild':
+            total = archive.rebuild()
+            print(f"[DONE] Indexed {total} entries")
+            return
+
+        start = time.perf_counter()
+        results = archive.search(args.query, args.folder, args.since, args.until, args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        for r in results:
+            print(f"[{r['time'][:16]}] {r['folder']}/{r['source']}")
+            print(f"    {make_snippet(r['text'], args.query)}")
+        print(f"\n{len(results)} match(es) in {elapsed_ms:.1f} ms")
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
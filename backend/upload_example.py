@@ -3,11 +3,14 @@ Incremental NotebookLM Uploader
 - Only uploads NEW files that haven't been uploaded before
 - Appends to existing documents when possible
 - Creates new volumes only when size limit is reached
+- Coalesces new files into chunks and uploads categories concurrently
 """
 import os
 import time
 import random
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
@@ -27,6 +30,10 @@ MAX_CHUNK_SIZE = 40000  # Upload in 40K chunks
 BASE_INTERVAL = 3.0
 MAX_RETRIES = 5
 JITTER_RANGE = (0.8, 1.2)
+MAX_WORKERS = 4  # Categories uploaded in parallel (they share one rate budget)
+
+# Guards state mutation + save_state across category workers
+state_lock = threading.Lock()
 
 
 class GoogleDocManager:
@@ -38,21 +45,45 @@ class GoogleDocManager:
                 'https://www.googleapis.com/auth/documents'
             ]
         )
-        self.drive_service = build('drive', 'v3', credentials=self.creds)
-        self.docs_service = build('docs', 'v1', credentials=self.creds)
+        # httplib2 is not thread-safe, so each worker thread builds its own services
+        self._local = threading.local()
+        # Shared rate budget: every thread reserves the next free call slot
+        self._rate_lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    @property
+    def drive_service(self):
+        if not hasattr(self._local, 'drive_service'):
+            self._local.drive_service = build('drive', 'v3', credentials=self.creds)
+        return self._local.drive_service
+
+    @property
+    def docs_service(self):
+        if not hasattr(self._local, 'docs_service'):
+            self._local.docs_service = build('docs', 'v1', credentials=self.creds)
+        return self._local.docs_service
+
+    def _wait_for_slot(self, delay):
+        """Block until this thread's slot in the shared rate budget comes up"""
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + delay
+        time.sleep(max(0.0, slot - now))
 
     def _rate_limited_call(self, api_call, **kwargs):
         """Rate-limited API call with retry logic"""
         for attempt in range(MAX_RETRIES + 1):
             try:
                 delay = BASE_INTERVAL * random.uniform(*JITTER_RANGE)
-                time.sleep(delay)
+                self._wait_for_slot(delay)
                 return api_call(**kwargs).execute()
             except HttpError as e:
                 if e.resp.status in [429, 500, 503]:
                     backoff = delay * (2 ** attempt)
-                    print(f"  [RETRY] API error {e.resp.status}, waiting {backoff:.1f}s...")
-                    time.sleep(backoff)
+                    tqdm.write(f"  [RETRY] API error {e.resp.status}, waiting {backoff:.1f}s...")
+                    # Back off the whole budget, not just this thread
+                    self._wait_for_slot(backoff)
                 else:
                     raise
         raise Exception("API call exceeded max retries")
@@ -203,11 +234,14 @@ def get_latest_volume(category_name, state, manager):
     latest_name = volume_names[-1]
     doc_info = docs[latest_name]
     
-    # Verify doc still exists and get current size
+    # Size is tracked in state on every append; only hit the API for old
+    # state entries that never recorded it
     doc_id = doc_info.get('id')
     if doc_id:
-        current_size = manager.get_doc_size(doc_id)
-        return latest_name, doc_id, current_size
+        current_size = doc_info.get('size')
+        if current_size is None:
+            current_size = manager.get_doc_size(doc_id)
+        return latest_name, doc_id, max(current_size, 1)
     
     return None, None, 0
 
@@ -237,85 +271,129 @@ def get_next_volume_name(category_name, state):
     return f"{category_name}-v{max_vol + 1}"
 
 
-def main():
-    print("[START] Incremental NotebookLM Uploader")
-    
-    manager = GoogleDocManager()
-    state = load_state()
+def build_chunks(category_path, new_files, start_size):
+    """
+    Group consecutive files into chunks of at most MAX_CHUNK_SIZE characters.
+    A chunk never straddles a volume boundary; a single file larger than
+    MAX_CHUNK_SIZE becomes its own chunk.
+    """
+    chunks = []
+    filenames, parts, chunk_size = [], [], 0
+    doc_size = start_size
     
-    # Get all categories
-    categories = sorted([d for d in os.listdir(TRANSCRIPTS_DIR)
-                        if os.path.isdir(os.path.join(TRANSCRIPTS_DIR, d))])
-    
-    print(f"[INFO] Found {len(categories)} categories")
-    
-    total_new_files = 0
-    categories_with_new = 0
-    
-    for category in tqdm(categories, desc="Checking"):
-        category_path = os.path.join(TRANSCRIPTS_DIR, category)
-        
-        # Check for new files
-        new_files = get_new_files(category_path, category, state)
+    for filename in new_files:
+        content = read_file_content(os.path.join(category_path, filename), filename)
+        if not content:
+            continue
         
-        if not new_files:
-            continue  # No new files, skip this category
+        content_size = len(content)
+        if not filenames and doc_size + content_size > MAX_DOC_SIZE:
+            # The chunk's first file already overflows: upload_category opens a new volume for it
+            doc_size = 1
+        too_big = chunk_size + content_size > MAX_CHUNK_SIZE
+        overflows_doc = doc_size + chunk_size + content_size > MAX_DOC_SIZE
+        if filenames and (too_big or overflows_doc):
+            chunks.append((filenames, ''.join(parts)))
+            doc_size = 1 if overflows_doc else doc_size + chunk_size
+            filenames, parts, chunk_size = [], [], 0
         
-        categories_with_new += 1
-        tqdm.write(f"\n[NEW] {category}: {len(new_files)} new file(s)")
-        
-        # Get current latest volume
+        filenames.append(filename)
+        parts.append(content)
+        chunk_size += content_size
+    
+    if filenames:
+        chunks.append((filenames, ''.join(parts)))
+    return chunks
+
+
+def upload_category(category, new_files, state, manager):
+    """Upload a category's new files, one append request per chunk"""
+    category_path = os.path.join(TRANSCRIPTS_DIR, category)
+    
+    with state_lock:
         current_vol_name, current_doc_id, current_size = get_latest_volume(category, state, manager)
+        state['uploaded_files'].setdefault(category, [])
+    
+    uploaded = 0
+    for filenames, content in build_chunks(category_path, new_files, current_size):
+        content_size = len(content)
         
-        # Initialize tracking
-        if category not in state['uploaded_files']:
-            state['uploaded_files'][category] = []
-        
-        for filename in new_files:
-            file_path = os.path.join(category_path, filename)
-            content = read_file_content(file_path, filename)
-            
-            if not content:
-                continue
-            
-            content_size = len(content)
-            
-            # Check if we need a new volume
-            if current_doc_id is None or (current_size + content_size > MAX_DOC_SIZE):
-                # Create new volume
+        # Check if we need a new volume
+        if current_doc_id is None or (current_size + content_size > MAX_DOC_SIZE):
+            with state_lock:
                 new_vol_name = get_next_volume_name(category, state)
-                tqdm.write(f"  [CREATE] New volume: {new_vol_name}")
-                new_doc_id = manager.create_document(new_vol_name)
-                
-                if new_doc_id:
-                    current_vol_name = new_vol_name
-                    current_doc_id = new_doc_id
-                    current_size = 1
+            tqdm.write(f"  [CREATE] {category}: new volume {new_vol_name}")
+            new_doc_id = manager.create_document(new_vol_name)
+            
+            if new_doc_id:
+                current_vol_name = new_vol_name
+                current_doc_id = new_doc_id
+                current_size = 1
+                with state_lock:
                     state['documents'][new_vol_name] = {
                         'id': new_doc_id,
                         'files': [],
                         'size': 0
                     }
                     save_state(state)
-                else:
-                    tqdm.write(f"  [FAIL] Could not create volume, skipping")
-                    continue
+            else:
+                tqdm.write(f"  [FAIL] {category}: could not create volume, skipping")
+                continue
+        
+        # Append the whole chunk to the current volume
+        if manager.append_content(current_doc_id, content):
+            current_size += content_size
+            uploaded += len(filenames)
             
-            # Append to current volume
-            if manager.append_content(current_doc_id, content):
-                current_size += content_size
-                total_new_files += 1
-                
-                # Update state
-                state['uploaded_files'][category].append(filename)
+            with state_lock:
+                state['uploaded_files'][category].extend(filenames)
                 if current_vol_name in state['documents']:
-                    state['documents'][current_vol_name]['files'].append(filename)
+                    state['documents'][current_vol_name]['files'].extend(filenames)
                     state['documents'][current_vol_name]['size'] = current_size
-                
                 save_state(state)
-                tqdm.write(f"  [OK] {filename}")
-            else:
-                tqdm.write(f"  [FAIL] {filename}")
+            tqdm.write(f"  [OK] {category}: {len(filenames)} file(s) ({content_size} chars)")
+        else:
+            tqdm.write(f"  [FAIL] {category}: {', '.join(filenames)}")
+    
+    return uploaded
+
+
+def main():
+    print("[START] Incremental NotebookLM Uploader")
+    
+    manager = GoogleDocManager()
+    state = load_state()
+    state.setdefault('uploaded_files', {})
+    state.setdefault('documents', {})
+    
+    # Get all categories
+    categories = sorted([d for d in os.listdir(TRANSCRIPTS_DIR)
+                        if os.path.isdir(os.path.join(TRANSCRIPTS_DIR, d))])
+    
+    print(f"[INFO] Found {len(categories)} categories")
+    
+    # Check for new files (local only, no API calls)
+    pending = {}
+    for category in categories:
+        new_files = get_new_files(os.path.join(TRANSCRIPTS_DIR, category), category, state)
+        if new_files:
+            pending[category] = new_files
+            print(f"[NEW] {category}: {len(new_files)} new file(s)")
+    
+    total_new_files = 0
+    categories_with_new = len(pending)
+    
+    # Categories are independent, so upload them concurrently
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(upload_category, category, new_files, state, manager): category
+            for category, new_files in pending.items()
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Uploading"):
+            try:
+                total_new_files += future.result()
+            except Exception as e:
+                tqdm.write(f"  [FAIL] {futures[future]}: {e}")
     
     if total_new_files == 0:
         print("\n[DONE] No new files to upload. Everything is up to date!")
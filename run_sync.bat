@@ -2,6 +2,10 @@
 REM Navigate to project directory FIRST (before any redirections)
 cd /d "%~dp0"
 
+REM Keep console.log bounded: roll it over at 10 MB (the Python JSON log rotates itself)
+if not exist logs mkdir logs
+if exist logs\console.log for %%F in (logs\console.log) do if %%~zF GTR 10485760 move /y logs\console.log logs\console.log.1 >nul
+
 REM Redirect all output to log file
 call :main >> logs/console.log 2>&1
 exit /b